@@ -0,0 +1,151 @@
+"""
+Dynamic batching for concurrent inference requests
+
+Views from requests that arrive within MAX_BATCH_DELAY of each other are
+concatenated into a single model call, then split back per request.
+"""
+
+import os
+import asyncio
+from concurrent.futures import Executor
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+
+MAX_BATCH_SIZE = int(os.getenv("MAX_BATCH_SIZE", "32"))
+MAX_BATCH_DELAY = float(os.getenv("MAX_BATCH_DELAY_MS", "5")) / 1000.0
+
+
+class DynamicBatcher:
+    """
+    Coalesce pending (N_views, 200, 200, 1) batches into one infer_fn call.
+
+    A batch is flushed when adding the next request would exceed
+    max_batch_size views, or max_delay seconds after its first request
+    arrived. The request that did not fit starts the next batch. A single
+    request larger than max_batch_size is run on its own.
+    """
+
+    def __init__(
+        self,
+        infer_fn: Callable[[np.ndarray], np.ndarray],
+        max_batch_size: int = MAX_BATCH_SIZE,
+        max_delay: float = MAX_BATCH_DELAY,
+        executor: Optional[Executor] = None
+    ):
+        self.infer_fn = infer_fn
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+        self.executor = executor
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+        # Request that overflowed the previous batch, first in the next one
+        self._carry: Optional[Tuple[np.ndarray, asyncio.Future]] = None
+
+    def start(self) -> None:
+        """Start the background batching task (must run inside the event loop)"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Cancel the background task and fail every request still waiting"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+        # Requests that never reached a batch would otherwise wait forever
+        pending = []
+        if self._carry is not None:
+            pending.append(self._carry)
+            self._carry = None
+        while not self._queue.empty():
+            pending.append(self._queue.get_nowait())
+        self._fail(pending, RuntimeError("Batcher stopped"))
+
+    async def submit(self, X: np.ndarray) -> np.ndarray:
+        """
+        Queue a batch of preprocessed views and wait for its predictions.
+
+        Returns:
+            Predictions for exactly the rows of X, shape (len(X), n_classes)
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((X, future))
+        return await future
+
+    @staticmethod
+    def _fail(items: List[Tuple[np.ndarray, asyncio.Future]], error: Exception) -> None:
+        """Raise error in every request of items that is still waiting"""
+        for _, fut in items:
+            if not fut.done():
+                fut.set_exception(error)
+
+    async def _collect(self, items: List[Tuple[np.ndarray, asyncio.Future]]) -> None:
+        """Wait for one request, then add more to items until full or timed out"""
+        loop = asyncio.get_running_loop()
+
+        if self._carry is not None:
+            first, self._carry = self._carry, None
+        else:
+            first = await self._queue.get()
+
+        items.append(first)
+        n_views = len(first[0])
+        deadline = loop.time() + self.max_delay
+
+        while n_views < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            if n_views + len(item[0]) > self.max_batch_size:
+                # Would overflow: keep it for the next batch
+                self._carry = item
+                break
+            items.append(item)
+            n_views += len(item[0])
+
+    async def _run(self) -> None:
+        # Filled in place, so requests already taken off the queue can be
+        # failed if the task is cancelled mid-batch
+        items: List[Tuple[np.ndarray, asyncio.Future]] = []
+        try:
+            while True:
+                items = []
+                await self._collect(items)
+
+                # Errors go to this batch's callers; the loop keeps serving others
+                try:
+                    await self._process(items)
+                except Exception as e:
+                    self._fail(items, e)
+        except asyncio.CancelledError:
+            self._fail(items, RuntimeError("Batcher stopped"))
+            raise
+
+    async def _process(self, items: List[Tuple[np.ndarray, asyncio.Future]]) -> None:
+        """Run one batch and resolve each request's future with its rows"""
+        loop = asyncio.get_running_loop()
+
+        # Drop requests whose caller already went away
+        items = [(X, fut) for X, fut in items if not fut.cancelled()]
+        if not items:
+            return
+
+        batch = np.concatenate([X for X, _ in items], axis=0)
+        preds = await loop.run_in_executor(self.executor, self.infer_fn, batch)
+
+        # Split predictions back to each request by row offset
+        offset = 0
+        for X, fut in items:
+            if not fut.done():
+                fut.set_result(preds[offset:offset + len(X)])
+            offset += len(X)
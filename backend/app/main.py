@@ -4,23 +4,40 @@ FastAPI Backend for NEU Surface Defect Detection
 
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, ORJSONResponse
 from pydantic import BaseModel
-from typing import List, Optional, Dict
+from typing import Callable, List, Optional, Dict
 import numpy as np
 import cv2
 import os
-import json
+import orjson
 import uuid
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 import base64
+import aiofiles
 
 # Import inference module
-from backend.inference.neu_inference import run_inference, CLASS_NAMES
+from backend.inference.neu_inference import (
+    run_inference,
+    preprocess_batch,
+    summarize_predictions,
+    get_infer_fn,
+    warmup_model,
+    CLASS_NAMES
+)
+from backend.app.store import create_store
+from backend.app.batching import DynamicBatcher
 
 
-app = FastAPI(title="NEU Quality Control API", version="1.0.0")
+app = FastAPI(
+    title="NEU Quality Control API",
+    version="1.0.0",
+    default_response_class=ORJSONResponse
+)
 
 # CORS configuration
 app.add_middleware(
@@ -39,8 +56,69 @@ REPORTS_DIR = DATA_DIR / "reports"
 UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
 REPORTS_DIR.mkdir(parents=True, exist_ok=True)
 
-# In-memory storage for pieces (in production, use a database)
-pieces_db: Dict[str, Dict] = {}
+# Uploads are streamed to disk in chunks of this size
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Accepted 3D model extensions (lowercase, without the dot), in display order
+ALLOWED_EXTS_ORDERED = ("stl", "obj", "gltf", "glb")
+ALLOWED_EXTS = frozenset(ALLOWED_EXTS_ORDERED)
+
+# Piece storage (in-process by default, Redis when REDIS_URL is set)
+store = create_store()
+
+# Worker pool for blocking decode + inference (keeps the event loop free)
+EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# Separate pool for per-view decoding (cv2.imdecode releases the GIL).
+# Kept apart from EXECUTOR so nested submits can never starve each other.
+DECODE_EXECUTOR = ThreadPoolExecutor(max_workers=os.cpu_count())
+
+# Single thread for model calls: TF already spreads each op over all cores
+INFER_EXECUTOR = ThreadPoolExecutor(max_workers=1)
+
+# Optional GPU JPEG decoding (nvJPEG via torchvision), detected at startup
+GPU_DECODE = False
+JPEG_MAGIC = b"\xff\xd8"
+
+# Coalesces concurrent requests into shared model calls (None in mock mode)
+batcher: Optional[DynamicBatcher] = None
+
+
+def _detect_gpu_decode() -> bool:
+    """
+    Check whether torchvision's nvJPEG decoder can be used.
+    Returns False if torch/torchvision are missing or there is no CUDA device.
+    """
+    try:
+        import torch
+        import torchvision.io  # noqa: F401
+        return torch.cuda.is_available()
+    except Exception:
+        return False
+
+
+@app.on_event("startup")
+async def load_model_on_startup():
+    """Load and warm up the model once, before serving requests"""
+    global GPU_DECODE, batcher
+    GPU_DECODE = _detect_gpu_decode()
+    if GPU_DECODE:
+        print("✅ CUDA available, decoding JPEG views with nvJPEG")
+    warmup_model()
+    
+    infer_fn = get_infer_fn()
+    if infer_fn is not None:
+        batcher = DynamicBatcher(infer_fn, executor=INFER_EXECUTOR)
+        batcher.start()
+
+
+@app.on_event("shutdown")
+async def stop_batcher_on_shutdown():
+    """Stop the background batching task"""
+    global batcher
+    if batcher is not None:
+        await batcher.stop()
+        batcher = None
 
 
 class AnalyzeRequest(BaseModel):
@@ -77,36 +155,37 @@ async def upload_file(file: UploadFile = File(...)):
     """
     Upload a 3D model file (.stl, .obj, .gltf, .glb)
     """
-    # Validate file extension
-    allowed_extensions = ['.stl', '.obj', '.gltf', '.glb']
-    file_ext = os.path.splitext(file.filename)[1].lower()
+    # Validate file extension (a bare ".stl" has no name, like splitext)
+    stem, _, ext = file.filename.rpartition('.')
+    ext = ext.lower()
     
-    if file_ext not in allowed_extensions:
+    if not stem or ext not in ALLOWED_EXTS:
+        allowed = ', '.join(f".{e}" for e in ALLOWED_EXTS_ORDERED)
         raise HTTPException(
             status_code=400,
-            detail=f"Invalid file type. Allowed: {', '.join(allowed_extensions)}"
+            detail=f"Invalid file type. Allowed: {allowed}"
         )
     
     # Generate unique piece ID
     piece_id = f"PIECE_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{str(uuid.uuid4())[:8].upper()}"
     
     # Save file
-    file_path = UPLOADS_DIR / f"{piece_id}{file_ext}"
+    file_path = UPLOADS_DIR / f"{piece_id}.{ext}"
     
     try:
-        contents = await file.read()
-        with open(file_path, "wb") as f:
-            f.write(contents)
+        async with aiofiles.open(file_path, "wb") as f:
+            while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+                await f.write(chunk)
         
         # Store piece metadata
-        pieces_db[piece_id] = {
+        await store.set(piece_id, {
             "id": piece_id,
             "filename": file.filename,
             "file_path": str(file_path),
             "uploaded_at": datetime.now().isoformat(),
             "status": "uploaded",
             "analysis_results": None
-        }
+        })
         
         return {
             "piece_id": piece_id,
@@ -118,29 +197,111 @@ async def upload_file(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail=f"Upload failed: {str(e)}")
 
 
-@app.post("/api/analyze")
-async def analyze(request: AnalyzeRequest):
-    piece_id = request.piece_id
-    if piece_id not in pieces_db:
-        raise HTTPException(status_code=404, detail="Piece not found")
-    
+def _decode_b64(img_b64: str) -> bytes:
+    """
+    Strip an optional data-URL prefix and decode the base64 payload.
+    """
+    # Single scan for the prefix; no copy when there is none
+    comma = img_b64.find(',')
+    if comma >= 0:
+        img_b64 = img_b64[comma + 1:]
+    return base64.b64decode(img_b64)
+
+
+def _imdecode_gray(img_data: bytes, index: int) -> np.ndarray:
+    """
+    Decode a single encoded image (PNG/JPEG) to grayscale uint8.
+    """
+    nparr = np.frombuffer(img_data, np.uint8)
+    img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
+    if img is None:
+        raise ValueError(f"Failed to decode image {index}")
+    return img
+
+
+def _decode_one(img_b64: str, index: int) -> np.ndarray:
+    """
+    Decode a single base64 view to grayscale uint8 (one DECODE_EXECUTOR task).
+    """
+    return _imdecode_gray(_decode_b64(img_b64), index)
+
+
+def _gpu_decode_jpegs(buffers: List[bytes]) -> Optional[List[np.ndarray]]:
+    """
+    Decode JPEG views on the GPU with nvJPEG.
+    Returns None on any failure so the caller can fall back to cv2.
+    """
     try:
-        images = []
-        for i, img_b64 in enumerate(request.images):
-            if ',' in img_b64:
-                img_b64 = img_b64.split(',')[1]
-            img_data = base64.b64decode(img_b64)
-            nparr = np.frombuffer(img_data, np.uint8)
-            img = cv2.imdecode(nparr, cv2.IMREAD_GRAYSCALE)
-            if img is None:
-                raise ValueError(f"Failed to decode image {i}")
-            images.append(img)
+        import torch
+        from torchvision.io import decode_jpeg, ImageReadMode
+        
+        tensors = [torch.frombuffer(bytearray(b), dtype=torch.uint8) for b in buffers]
+        try:
+            decoded = decode_jpeg(tensors, mode=ImageReadMode.GRAY, device="cuda")
+        except Exception:
+            # Batched decode is unstable on some torchvision/CUDA versions
+            decoded = [
+                decode_jpeg(t, mode=ImageReadMode.GRAY, device="cuda")
+                for t in tensors
+            ]
         
-        results = run_inference(images, piece_id=piece_id)
+        # (1, H, W) on device -> (H, W) uint8 on host for preprocessing
+        return [t[0].cpu().numpy() for t in decoded]
+    except Exception as e:
+        print(f"⚠️  GPU decode failed ({e}), falling back to CPU")
+        return None
+
+
+def _decode_views(request: AnalyzeRequest) -> List[np.ndarray]:
+    """
+    Decode the base64 views to grayscale images (blocking, runs in EXECUTOR).
+    """
+    n_views = len(request.images)
+    
+    if not GPU_DECODE:
+        return list(DECODE_EXECUTOR.map(_decode_one, request.images, range(n_views)))
+    
+    # The JPEG check needs the raw bytes. b64decode holds the GIL, so run it
+    # inline rather than paying a pool round-trip per view.
+    buffers = [_decode_b64(img_b64) for img_b64 in request.images]
+    
+    if all(buf[:2] == JPEG_MAGIC for buf in buffers):
+        images = _gpu_decode_jpegs(buffers)
+        if images is not None:
+            return images
+    
+    return list(DECODE_EXECUTOR.map(_imdecode_gray, buffers, range(n_views)))
+
+
+async def _infer(images: List[np.ndarray], piece_id: str) -> Dict:
+    """
+    Run inference for one piece, through the dynamic batcher when a model is loaded.
+    """
+    loop = asyncio.get_running_loop()
+    
+    if batcher is None:
+        return await loop.run_in_executor(EXECUTOR, run_inference, images, piece_id)
+    
+    X = await loop.run_in_executor(EXECUTOR, preprocess_batch, images)
+    preds = await batcher.submit(X)
+    return summarize_predictions(preds)
+
+
+async def _analyze_piece(piece_id: str, decode: Callable[[], List[np.ndarray]]) -> Dict:
+    """
+    Decode views (in EXECUTOR), run inference and store the results.
+    Shared by /api/analyze and /api/analyze_raw.
+    """
+    try:
+        loop = asyncio.get_running_loop()
+        images = await loop.run_in_executor(EXECUTOR, decode)
+        results = await _infer(images, piece_id)
         
-        pieces_db[piece_id]["analysis_results"] = results
-        pieces_db[piece_id]["analyzed_at"] = datetime.now().isoformat()
-        pieces_db[piece_id]["status"] = "analyzed"
+        await store.update(piece_id, {
+            "analysis_results": results,
+            "analyzed_at": datetime.now().isoformat(),
+            "status": "analyzed"
+        })
         
         return {"piece_id": piece_id, "results": results}
     
@@ -149,6 +310,59 @@ async def analyze(request: AnalyzeRequest):
         print("❌ Analysis error traceback:\n", traceback.format_exc())
         raise HTTPException(status_code=500, detail=f"Analysis failed: {str(e)}")
 
+
+def _wrap_raw_views(buffers: List[bytes], width: int, height: int) -> List[np.ndarray]:
+    """
+    View raw 8-bit grayscale buffers as (height, width) images (no copy).
+    """
+    return [np.frombuffer(data, np.uint8).reshape(height, width) for data in buffers]
+
+
+@app.post("/api/analyze")
+async def analyze(request: AnalyzeRequest):
+    piece_id = request.piece_id
+    if await store.get(piece_id) is None:
+        raise HTTPException(status_code=404, detail="Piece not found")
+    
+    if not request.images:
+        raise HTTPException(status_code=400, detail="No images provided")
+    
+    return await _analyze_piece(piece_id, functools.partial(_decode_views, request))
+
+
+@app.post("/api/analyze_raw")
+async def analyze_raw(
+    piece_id: str = Form(...),
+    width: int = Form(...),
+    height: int = Form(...),
+    files: List[UploadFile] = File(...)
+):
+    """
+    Analyze views sent as raw 8-bit grayscale pixel buffers (multipart).
+    Each file must hold exactly width * height bytes, row-major.
+    Skips the base64 and PNG decode done by /api/analyze.
+    """
+    if await store.get(piece_id) is None:
+        raise HTTPException(status_code=404, detail="Piece not found")
+    
+    if width <= 0 or height <= 0:
+        raise HTTPException(status_code=400, detail="width and height must be positive")
+    
+    buffers = []
+    for i, f in enumerate(files):
+        data = await f.read()
+        if len(data) != width * height:
+            raise HTTPException(
+                status_code=400,
+                detail=f"Image {i} has {len(data)} bytes, expected {width * height}"
+            )
+        buffers.append(data)
+    
+    return await _analyze_piece(
+        piece_id, functools.partial(_wrap_raw_views, buffers, width, height)
+    )
+
+
 @app.post("/api/report")
 async def generate_report(request: ReportRequest):
     """
@@ -156,11 +370,10 @@ async def generate_report(request: ReportRequest):
     """
     piece_id = request.piece_id
     
-    if piece_id not in pieces_db:
+    piece = await store.get(piece_id)
+    if piece is None:
         raise HTTPException(status_code=404, detail="Piece not found")
     
-    piece = pieces_db[piece_id]
-    
     if not piece.get("analysis_results"):
         raise HTTPException(status_code=400, detail="Piece has not been analyzed yet")
     
@@ -177,10 +390,11 @@ async def generate_report(request: ReportRequest):
     
     # Save report as JSON (in production, generate PDF)
     report_path = REPORTS_DIR / f"{piece_id}_report.json"
-    with open(report_path, "w") as f:
-        json.dump(report_data, f, indent=2)
+    data = orjson.dumps(report_data, option=orjson.OPT_INDENT_2)
+    async with aiofiles.open(report_path, "wb") as f:
+        await f.write(data)
     
-    piece["report_path"] = str(report_path)
+    await store.update(piece_id, {"report_path": str(report_path)})
     
     return {
         "piece_id": piece_id,
@@ -196,12 +410,14 @@ async def validate_piece(request: ValidationRequest):
     """
     piece_id = request.piece_id
     
-    if piece_id not in pieces_db:
+    if await store.get(piece_id) is None:
         raise HTTPException(status_code=404, detail="Piece not found")
     
-    pieces_db[piece_id]["status"] = "validated"
-    pieces_db[piece_id]["validated_at"] = datetime.now().isoformat()
-    pieces_db[piece_id]["validation_notes"] = request.notes
+    await store.update(piece_id, {
+        "status": "validated",
+        "validated_at": datetime.now().isoformat(),
+        "validation_notes": request.notes
+    })
     
     return {
         "piece_id": piece_id,
@@ -217,12 +433,14 @@ async def reject_piece(request: ValidationRequest):
     """
     piece_id = request.piece_id
     
-    if piece_id not in pieces_db:
+    if await store.get(piece_id) is None:
         raise HTTPException(status_code=404, detail="Piece not found")
     
-    pieces_db[piece_id]["status"] = "rejected"
-    pieces_db[piece_id]["rejected_at"] = datetime.now().isoformat()
-    pieces_db[piece_id]["rejection_notes"] = request.notes
+    await store.update(piece_id, {
+        "status": "rejected",
+        "rejected_at": datetime.now().isoformat(),
+        "rejection_notes": request.notes
+    })
     
     return {
         "piece_id": piece_id,
@@ -236,10 +454,11 @@ async def get_piece(piece_id: str):
     """
     Get piece information by ID.
     """
-    if piece_id not in pieces_db:
+    piece = await store.get(piece_id)
+    if piece is None:
         raise HTTPException(status_code=404, detail="Piece not found")
     
-    return pieces_db[piece_id]
+    return piece
 
 
 @app.get("/api/pieces")
@@ -247,7 +466,7 @@ async def list_pieces():
     """
     List all pieces.
     """
-    return {"pieces": list(pieces_db.values())}
+    return {"pieces": await store.list()}
 
 
 @app.get("/api/classes")
@@ -263,4 +482,10 @@ async def get_classes():
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    # WEB_CONCURRENCY adds worker processes (TF inference is GIL-bound)
+    uvicorn.run(
+        "backend.app.main:app",
+        host="0.0.0.0",
+        port=8000,
+        workers=int(os.getenv("WEB_CONCURRENCY", "1"))
+    )
@@ -0,0 +1,114 @@
+"""
+Piece metadata storage
+
+The in-process store is the default. Set REDIS_URL to share pieces across
+uvicorn workers and keep them across restarts.
+"""
+
+import os
+import orjson
+from abc import ABC, abstractmethod
+from typing import Any, Dict, List, Optional
+
+
+REDIS_URL = os.getenv("REDIS_URL")
+REDIS_KEY_PREFIX = "neu:piece:"
+
+
+class PieceStore(ABC):
+    """Interface for piece metadata storage"""
+
+    @abstractmethod
+    async def get(self, piece_id: str) -> Optional[Dict]:
+        """Return the piece, or None if it does not exist"""
+
+    @abstractmethod
+    async def set(self, piece_id: str, piece: Dict) -> None:
+        """Create or replace a whole piece"""
+
+    @abstractmethod
+    async def update(self, piece_id: str, fields: Dict[str, Any]) -> None:
+        """Write only the given fields, leaving the others untouched"""
+
+    @abstractmethod
+    async def list(self) -> List[Dict]:
+        """Return all pieces"""
+
+
+class MemoryPieceStore(PieceStore):
+    """In-process piece storage (single worker only)"""
+
+    def __init__(self):
+        self._pieces: Dict[str, Dict] = {}
+
+    async def get(self, piece_id: str) -> Optional[Dict]:
+        return self._pieces.get(piece_id)
+
+    async def set(self, piece_id: str, piece: Dict) -> None:
+        self._pieces[piece_id] = piece
+
+    async def update(self, piece_id: str, fields: Dict[str, Any]) -> None:
+        self._pieces[piece_id].update(fields)
+
+    async def list(self) -> List[Dict]:
+        return list(self._pieces.values())
+
+
+class RedisPieceStore(PieceStore):
+    """
+    Redis-backed piece storage.
+    Each piece is a hash of JSON-encoded fields, so concurrent handlers
+    updating different fields never overwrite each other.
+    """
+
+    def __init__(self, url: Optional[str] = None, client=None):
+        if client is None:
+            import redis.asyncio as redis
+            client = redis.Redis.from_url(url, decode_responses=True)
+        self._redis = client
+
+    def _key(self, piece_id: str) -> str:
+        return f"{REDIS_KEY_PREFIX}{piece_id}"
+
+    @staticmethod
+    def _encode(fields: Dict[str, Any]) -> Dict[str, bytes]:
+        return {name: orjson.dumps(value) for name, value in fields.items()}
+
+    @staticmethod
+    def _decode(raw: Dict[str, str]) -> Optional[Dict]:
+        if not raw:
+            return None
+        return {name: orjson.loads(value) for name, value in raw.items()}
+
+    async def get(self, piece_id: str) -> Optional[Dict]:
+        return self._decode(await self._redis.hgetall(self._key(piece_id)))
+
+    async def set(self, piece_id: str, piece: Dict) -> None:
+        key = self._key(piece_id)
+        async with self._redis.pipeline(transaction=True) as pipe:
+            pipe.delete(key)
+            pipe.hset(key, mapping=self._encode(piece))
+            await pipe.execute()
+
+    async def update(self, piece_id: str, fields: Dict[str, Any]) -> None:
+        await self._redis.hset(self._key(piece_id), mapping=self._encode(fields))
+
+    async def list(self) -> List[Dict]:
+        keys = [key async for key in self._redis.scan_iter(match=f"{REDIS_KEY_PREFIX}*")]
+        if not keys:
+            return []
+        async with self._redis.pipeline(transaction=False) as pipe:
+            for key in keys:
+                pipe.hgetall(key)
+            raws = await pipe.execute()
+        return [piece for piece in map(self._decode, raws) if piece is not None]
+
+
+def create_store() -> PieceStore:
+    """
+    Build the piece store selected by the environment.
+    """
+    if REDIS_URL:
+        print(f"✅ Using Redis piece store at {REDIS_URL}")
+        return RedisPieceStore(REDIS_URL)
+    return MemoryPieceStore()
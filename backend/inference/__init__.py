@@ -1,3 +1,17 @@
-from .neu_inference import run_inference, preprocess_image, CLASS_NAMES, IMG_SIZE
+from .neu_inference import (
+    run_inference,
+    preprocess_image,
+    preprocess_batch,
+    summarize_predictions,
+    CLASS_NAMES,
+    IMG_SIZE
+)
 
-__all__ = ['run_inference', 'preprocess_image', 'CLASS_NAMES', 'IMG_SIZE']
+__all__ = [
+    'run_inference',
+    'preprocess_image',
+    'preprocess_batch',
+    'summarize_predictions',
+    'CLASS_NAMES',
+    'IMG_SIZE'
+]
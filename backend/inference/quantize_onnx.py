@@ -0,0 +1,49 @@
+"""
+Offline conversion of the Keras model to an INT8 ONNX model
+
+Usage (from the repository root):
+    pip install tf2onnx onnxruntime
+    python -m backend.inference.quantize_onnx
+
+The output is served by neu_inference (ONNX_MODEL_PATH) when USE_ONNX=1.
+"""
+
+import os
+import argparse
+
+from backend.inference.neu_inference import IMG_SIZE, MODEL_PATH, ONNX_MODEL_PATH
+
+
+def convert(keras_path: str, onnx_path: str) -> None:
+    """
+    Export the Keras model to ONNX, then apply dynamic INT8 weight quantization.
+    """
+    import tensorflow as tf
+    import tf2onnx
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    model = tf.keras.models.load_model(keras_path)
+    spec = (tf.TensorSpec((None, IMG_SIZE, IMG_SIZE, 1), tf.float32, name="input"),)
+
+    fp32_path = onnx_path.replace(".int8.onnx", ".onnx")
+    if fp32_path == onnx_path:
+        fp32_path = onnx_path + ".fp32"
+
+    tf2onnx.convert.from_keras(model, input_signature=spec, output_path=fp32_path)
+    print(f"✅ Exported FP32 ONNX model to {fp32_path}")
+
+    quantize_dynamic(fp32_path, onnx_path, weight_type=QuantType.QInt8)
+    print(f"✅ Quantized INT8 ONNX model to {onnx_path}")
+
+    fp32_size = os.path.getsize(fp32_path) / 1e6
+    int8_size = os.path.getsize(onnx_path) / 1e6
+    print(f"   Size: {fp32_size:.1f} MB -> {int8_size:.1f} MB")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert the NEU CNN to INT8 ONNX")
+    parser.add_argument("--keras", default=MODEL_PATH, help="Input Keras model")
+    parser.add_argument("--output", default=ONNX_MODEL_PATH, help="Output INT8 ONNX model")
+    args = parser.parse_args()
+
+    convert(args.keras, args.output)
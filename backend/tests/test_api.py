@@ -7,17 +7,29 @@ from fastapi.testclient import TestClient
 import sys
 from pathlib import Path
 import base64
+import json
+from datetime import datetime
 import numpy as np
 import cv2
 
 # Add backend to path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from app.main import app
+from app import main as main_module
+from app.main import app, AnalyzeRequest
 
 client = TestClient(app)
 
 
+@pytest.fixture(autouse=True)
+def data_dirs(tmp_path, monkeypatch):
+    """Write uploads and reports to a temporary directory, not the repo's data/"""
+    monkeypatch.setattr(main_module, "UPLOADS_DIR", tmp_path / "uploads")
+    monkeypatch.setattr(main_module, "REPORTS_DIR", tmp_path / "reports")
+    (tmp_path / "uploads").mkdir()
+    (tmp_path / "reports").mkdir()
+
+
 class TestHealthCheck:
     """Test basic health endpoints"""
     
@@ -55,6 +67,19 @@ class TestUpload:
         assert "piece_id" in data
         assert data["filename"] == "test.stl"
     
+    def test_upload_streams_large_file(self):
+        """Test a multi-chunk upload is written to disk intact"""
+        fake_stl = np.random.randint(0, 256, 3 * 1024 * 1024 + 17, dtype=np.uint8).tobytes()
+        
+        response = client.post(
+            "/api/upload",
+            files={"file": ("large.stl", fake_stl, "application/octet-stream")}
+        )
+        
+        assert response.status_code == 200
+        piece = client.get(f"/api/pieces/{response.json()['piece_id']}").json()
+        assert Path(piece["file_path"]).read_bytes() == fake_stl
+    
     def test_upload_invalid_extension(self):
         """Test uploading invalid file type"""
         fake_content = b"test content"
@@ -65,6 +90,55 @@ class TestUpload:
         )
         
         assert response.status_code == 400
+        assert response.json()["detail"] == "Invalid file type. Allowed: .stl, .obj, .gltf, .glb"
+    
+    def test_upload_extension_case_insensitive(self):
+        """Test uppercase extensions are accepted and saved lowercase"""
+        response = client.post(
+            "/api/upload",
+            files={"file": ("PART.GLB", b"glTF", "application/octet-stream")}
+        )
+        
+        assert response.status_code == 200
+        piece = client.get(f"/api/pieces/{response.json()['piece_id']}").json()
+        assert piece["file_path"].endswith(".glb")
+    
+    def test_upload_without_extension(self):
+        """Test files without a name or extension are rejected"""
+        for filename in ["stl", ".stl"]:
+            response = client.post(
+                "/api/upload",
+                files={"file": (filename, b"solid test", "application/octet-stream")}
+            )
+            
+            assert response.status_code == 400
+
+
+class TestPieces:
+    """Test piece lookup endpoints"""
+    
+    def test_get_and_list_pieces(self):
+        """Test an uploaded piece can be fetched and is listed"""
+        fake_stl = b"solid test\nendsolid test"
+        upload_response = client.post(
+            "/api/upload",
+            files={"file": ("test.stl", fake_stl, "application/octet-stream")}
+        )
+        piece_id = upload_response.json()["piece_id"]
+        
+        response = client.get(f"/api/pieces/{piece_id}")
+        assert response.status_code == 200
+        assert response.json()["status"] == "uploaded"
+        datetime.fromisoformat(response.json()["uploaded_at"])
+        
+        response = client.get("/api/pieces")
+        assert response.status_code == 200
+        assert piece_id in [p["id"] for p in response.json()["pieces"]]
+    
+    def test_get_nonexistent_piece(self):
+        """Test fetching an unknown piece returns 404"""
+        response = client.get("/api/pieces/NONEXISTENT")
+        assert response.status_code == 404
 
 
 class TestAnalysis:
@@ -101,6 +175,64 @@ class TestAnalysis:
         assert "class_probs" in data["results"]
         assert "anomaly_score" in data["results"]
     
+    def test_analyze_data_url_images(self):
+        """Test views sent as full data URLs are accepted"""
+        fake_stl = b"solid test\nendsolid test"
+        upload_response = client.post(
+            "/api/upload",
+            files={"file": ("test.stl", fake_stl, "application/octet-stream")}
+        )
+        piece_id = upload_response.json()["piece_id"]
+        
+        img = np.random.randint(0, 256, (200, 200), dtype=np.uint8)
+        _, buffer = cv2.imencode('.png', img)
+        data_url = "data:image/png;base64," + base64.b64encode(buffer).decode('utf-8')
+        
+        response = client.post(
+            "/api/analyze",
+            json={"piece_id": piece_id, "images": [data_url]}
+        )
+        
+        assert response.status_code == 200
+    
+    def test_analyze_undecodable_image(self):
+        """Test analysis fails cleanly when a view cannot be decoded"""
+        fake_stl = b"solid test\nendsolid test"
+        upload_response = client.post(
+            "/api/upload",
+            files={"file": ("test.stl", fake_stl, "application/octet-stream")}
+        )
+        piece_id = upload_response.json()["piece_id"]
+        
+        img = np.random.randint(0, 256, (200, 200), dtype=np.uint8)
+        _, buffer = cv2.imencode('.png', img)
+        img_b64 = base64.b64encode(buffer).decode('utf-8')
+        bad_b64 = base64.b64encode(b"not an image").decode('utf-8')
+        
+        response = client.post(
+            "/api/analyze",
+            json={"piece_id": piece_id, "images": [img_b64, bad_b64]}
+        )
+        
+        assert response.status_code == 500
+        assert "image 1" in response.json()["detail"]
+    
+    def test_analyze_without_images(self):
+        """Test an empty image list is rejected before inference"""
+        fake_stl = b"solid test\nendsolid test"
+        upload_response = client.post(
+            "/api/upload",
+            files={"file": ("test.stl", fake_stl, "application/octet-stream")}
+        )
+        piece_id = upload_response.json()["piece_id"]
+        
+        response = client.post(
+            "/api/analyze",
+            json={"piece_id": piece_id, "images": []}
+        )
+        
+        assert response.status_code == 400
+    
     def test_analyze_nonexistent_piece(self):
         """Test analyzing non-existent piece"""
         response = client.post(
@@ -114,6 +246,180 @@ class TestAnalysis:
         assert response.status_code == 404
 
 
+class TestDecodeRouting:
+    """Test routing between GPU (nvJPEG) and cv2 decoding"""
+    
+    def _encode(self, ext, shape):
+        img = np.random.randint(0, 256, shape, dtype=np.uint8)
+        _, buffer = cv2.imencode(ext, img)
+        return base64.b64encode(buffer).decode('utf-8')
+    
+    def test_all_jpeg_uses_gpu(self, monkeypatch):
+        """Test all-JPEG requests are decoded on the GPU path"""
+        gpu_images = [np.zeros((10, 10), np.uint8), np.ones((20, 20), np.uint8)]
+        calls = []
+        
+        def fake_gpu(buffers):
+            calls.append(len(buffers))
+            return gpu_images
+        
+        monkeypatch.setattr(main_module, "GPU_DECODE", True)
+        monkeypatch.setattr(main_module, "_gpu_decode_jpegs", fake_gpu)
+        
+        request = AnalyzeRequest(
+            piece_id="TEST",
+            images=[self._encode('.jpg', (50, 60)), self._encode('.jpg', (70, 80))]
+        )
+        images = main_module._decode_views(request)
+        
+        assert calls == [2]
+        assert images is gpu_images
+    
+    def test_png_falls_back_to_cv2(self, monkeypatch):
+        """Test a PNG in the request skips the GPU path"""
+        def fake_gpu(buffers):
+            raise AssertionError("GPU path should not be used for PNG")
+        
+        monkeypatch.setattr(main_module, "GPU_DECODE", True)
+        monkeypatch.setattr(main_module, "_gpu_decode_jpegs", fake_gpu)
+        
+        request = AnalyzeRequest(
+            piece_id="TEST",
+            images=[self._encode('.jpg', (50, 60)), self._encode('.png', (70, 80))]
+        )
+        images = main_module._decode_views(request)
+        
+        assert [img.shape for img in images] == [(50, 60), (70, 80)]
+    
+    def test_gpu_failure_falls_back_to_cv2(self, monkeypatch):
+        """Test a failed GPU decode falls back to cv2 in request order"""
+        monkeypatch.setattr(main_module, "GPU_DECODE", True)
+        monkeypatch.setattr(main_module, "_gpu_decode_jpegs", lambda buffers: None)
+        
+        shapes = [(50, 60), (70, 80), (30, 40)]
+        request = AnalyzeRequest(
+            piece_id="TEST",
+            images=[self._encode('.jpg', shape) for shape in shapes]
+        )
+        images = main_module._decode_views(request)
+        
+        assert [img.shape for img in images] == shapes
+
+
+class TestBatchedInference:
+    """Test analysis through the dynamic batcher with a loaded model"""
+    
+    def test_analyze_uses_batcher(self, monkeypatch):
+        """Test views go preprocess_batch -> batcher -> summarize_predictions"""
+        from backend.inference import neu_inference
+        
+        probs = np.array([0.05, 0.6, 0.1, 0.1, 0.1, 0.05], dtype=np.float32)
+        calls = []
+        
+        def fake_infer(X):
+            calls.append(X.shape)
+            return np.tile(probs, (len(X), 1))
+        
+        # Stub the cached model; restore main's globals set by startup
+        monkeypatch.setattr(neu_inference, "_INFER_FN", fake_infer)
+        monkeypatch.setattr(neu_inference, "_MODEL_LOADED", True)
+        monkeypatch.setattr(main_module, "batcher", None)
+        monkeypatch.setattr(main_module, "GPU_DECODE", False)
+        
+        img = np.random.randint(0, 256, (150, 250), dtype=np.uint8)
+        _, buffer = cv2.imencode('.png', img)
+        img_b64 = base64.b64encode(buffer).decode('utf-8')
+        
+        # Context manager runs the startup hook, which starts the batcher
+        with TestClient(app) as batched_client:
+            assert main_module.batcher is not None
+            
+            upload_response = batched_client.post(
+                "/api/upload",
+                files={"file": ("test.stl", b"solid test", "application/octet-stream")}
+            )
+            piece_id = upload_response.json()["piece_id"]
+            
+            response = batched_client.post(
+                "/api/analyze",
+                json={"piece_id": piece_id, "images": [img_b64, img_b64]}
+            )
+        
+        assert response.status_code == 200
+        results = response.json()["results"]
+        assert results["predicted_class"] == "inclusion"
+        assert results["anomaly_score"] == pytest.approx(60.0)
+        # Warmup call, then one batch holding both preprocessed views
+        assert calls == [(1, 200, 200, 1), (2, 200, 200, 1)]
+        assert main_module.batcher is None
+
+
+class TestAnalyzeRaw:
+    """Test raw-pixel analysis endpoint"""
+    
+    def _upload_piece(self):
+        fake_stl = b"solid test\nendsolid test"
+        upload_response = client.post(
+            "/api/upload",
+            files={"file": ("test.stl", fake_stl, "application/octet-stream")}
+        )
+        return upload_response.json()["piece_id"]
+    
+    def test_analyze_raw_pixels(self):
+        """Test analysis with raw grayscale buffers"""
+        piece_id = self._upload_piece()
+        
+        img = np.random.randint(0, 256, (150, 200), dtype=np.uint8)
+        response = client.post(
+            "/api/analyze_raw",
+            data={"piece_id": piece_id, "width": "200", "height": "150"},
+            files=[
+                ("files", ("view0.raw", img.tobytes(), "application/octet-stream")),
+                ("files", ("view1.raw", img.tobytes(), "application/octet-stream")),
+            ]
+        )
+        
+        assert response.status_code == 200
+        data = response.json()
+        assert data["results"]["predicted_class"] in data["results"]["class_probs"]
+    
+    def test_analyze_raw_size_mismatch(self):
+        """Test buffers that do not match width * height are rejected"""
+        piece_id = self._upload_piece()
+        
+        response = client.post(
+            "/api/analyze_raw",
+            data={"piece_id": piece_id, "width": "200", "height": "200"},
+            files=[("files", ("view0.raw", b"\x00" * 100, "application/octet-stream"))]
+        )
+        
+        assert response.status_code == 400
+    
+    def test_analyze_raw_invalid_dimensions(self):
+        """Test zero or negative dimensions are rejected"""
+        piece_id = self._upload_piece()
+        
+        for width, height in [("-200", "200"), ("200", "0")]:
+            response = client.post(
+                "/api/analyze_raw",
+                data={"piece_id": piece_id, "width": width, "height": height},
+                files=[("files", ("view0.raw", b"\x00" * 100, "application/octet-stream"))]
+            )
+            
+            assert response.status_code == 400
+    
+    def test_analyze_raw_without_files(self):
+        """Test a request without any views is rejected by form validation"""
+        piece_id = self._upload_piece()
+        
+        response = client.post(
+            "/api/analyze_raw",
+            data={"piece_id": piece_id, "width": "200", "height": "200"}
+        )
+        
+        assert response.status_code == 422
+
+
 class TestReport:
     """Test report generation"""
     
@@ -149,6 +455,33 @@ class TestReport:
         assert report_response.status_code == 200
         data = report_response.json()
         assert "report_path" in data
+    
+    def test_report_file_contents(self):
+        """Test the written report holds the analysis results"""
+        fake_stl = b"solid test\nendsolid test"
+        upload_response = client.post(
+            "/api/upload",
+            files={"file": ("test.stl", fake_stl, "application/octet-stream")}
+        )
+        piece_id = upload_response.json()["piece_id"]
+        
+        img = np.random.randint(0, 256, (200, 200), dtype=np.uint8)
+        _, buffer = cv2.imencode('.png', img)
+        img_b64 = base64.b64encode(buffer).decode('utf-8')
+        analyze_response = client.post(
+            "/api/analyze",
+            json={"piece_id": piece_id, "images": [img_b64]}
+        )
+        
+        report_response = client.post(
+            "/api/report",
+            json={"piece_id": piece_id, "notes": "Check contents"}
+        )
+        
+        report = json.loads(Path(report_response.json()["report_path"]).read_text())
+        assert report["piece_id"] == piece_id
+        assert report["notes"] == "Check contents"
+        assert report["results"] == analyze_response.json()["results"]
 
 
 class TestValidation:
@@ -0,0 +1,171 @@
+"""
+Tests for the dynamic batcher
+"""
+
+import pytest
+import asyncio
+import time
+import numpy as np
+import sys
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.batching import DynamicBatcher
+
+
+def _views(n, value):
+    """Create n fake preprocessed views filled with value"""
+    return np.full((n, 200, 200, 1), value, dtype=np.float32)
+
+
+def _fake_infer(calls):
+    """Fake model returning each view's fill value, recording batch sizes"""
+    def infer(X):
+        calls.append(len(X))
+        return np.repeat(X[:, 0, 0, :], 6, axis=1)
+    return infer
+
+
+class TestDynamicBatcher:
+    """Test request coalescing and result splitting"""
+
+    def test_concurrent_requests_share_one_call(self):
+        """Test concurrent submits are merged and split back correctly"""
+        calls = []
+
+        async def scenario():
+            batcher = DynamicBatcher(_fake_infer(calls), max_batch_size=32, max_delay=0.05)
+            batcher.start()
+            try:
+                return await asyncio.gather(
+                    batcher.submit(_views(2, 1.0)),
+                    batcher.submit(_views(3, 2.0)),
+                    batcher.submit(_views(1, 3.0)),
+                )
+            finally:
+                await batcher.stop()
+
+        results = asyncio.run(scenario())
+
+        assert calls == [6]
+        assert [len(r) for r in results] == [2, 3, 1]
+        for r, value in zip(results, [1.0, 2.0, 3.0]):
+            assert np.all(r == value)
+
+    def test_flushes_when_full(self):
+        """Test a full batch is flushed without waiting for more requests"""
+        calls = []
+
+        async def scenario():
+            batcher = DynamicBatcher(_fake_infer(calls), max_batch_size=4, max_delay=0.05)
+            batcher.start()
+            try:
+                await asyncio.gather(
+                    batcher.submit(_views(4, 1.0)),
+                    batcher.submit(_views(2, 2.0)),
+                )
+            finally:
+                await batcher.stop()
+
+        asyncio.run(scenario())
+
+        assert calls == [4, 2]
+
+    def test_never_exceeds_max_batch_size(self):
+        """Test a request that would overflow the batch starts the next one"""
+        calls = []
+
+        async def scenario():
+            batcher = DynamicBatcher(_fake_infer(calls), max_batch_size=4, max_delay=0.05)
+            batcher.start()
+            try:
+                return await asyncio.gather(
+                    batcher.submit(_views(1, 1.0)),
+                    batcher.submit(_views(8, 2.0)),
+                    batcher.submit(_views(3, 3.0)),
+                )
+            finally:
+                await batcher.stop()
+
+        results = asyncio.run(scenario())
+
+        assert calls == [1, 8, 3]
+        for r, (n, value) in zip(results, [(1, 1.0), (8, 2.0), (3, 3.0)]):
+            assert len(r) == n
+            assert np.all(r == value)
+
+    def test_survives_batch_errors(self):
+        """Test a failing batch does not stop later requests from being served"""
+        calls = []
+
+        async def scenario():
+            batcher = DynamicBatcher(_fake_infer(calls), max_delay=0.05)
+            batcher.start()
+            try:
+                # Mismatched view shapes cannot be concatenated
+                bad = await asyncio.gather(
+                    batcher.submit(_views(1, 1.0)),
+                    batcher.submit(np.zeros((1, 10, 10, 1), np.float32)),
+                    return_exceptions=True
+                )
+                good = await asyncio.wait_for(batcher.submit(_views(2, 5.0)), 1.0)
+                return bad, good
+            finally:
+                await batcher.stop()
+
+        bad, good = asyncio.run(scenario())
+
+        assert all(isinstance(r, ValueError) for r in bad)
+        assert np.all(good == 5.0)
+
+    def test_errors_propagate_to_callers(self):
+        """Test model errors are raised in every waiting request"""
+        def failing_infer(X):
+            raise RuntimeError("model failed")
+
+        async def scenario():
+            batcher = DynamicBatcher(failing_infer, max_delay=0.01)
+            batcher.start()
+            try:
+                return await asyncio.gather(
+                    batcher.submit(_views(1, 1.0)),
+                    batcher.submit(_views(1, 2.0)),
+                    return_exceptions=True
+                )
+            finally:
+                await batcher.stop()
+
+        results = asyncio.run(scenario())
+
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+    def test_stop_fails_pending_requests(self):
+        """Test requests in flight, carried over or queued fail on stop instead of hanging"""
+        def slow_infer(X):
+            time.sleep(0.2)
+            return np.zeros((len(X), 6), np.float32)
+
+        async def scenario():
+            batcher = DynamicBatcher(slow_infer, max_batch_size=2, max_delay=0.05)
+            batcher.start()
+            # In flight, carried over (would overflow), still queued
+            tasks = [
+                asyncio.ensure_future(batcher.submit(_views(n, 1.0)))
+                for n in (1, 2, 1)
+            ]
+            await asyncio.sleep(0.05)
+            await batcher.stop()
+            return await asyncio.wait_for(
+                asyncio.gather(*tasks, return_exceptions=True), 1.0
+            )
+
+        results = asyncio.run(scenario())
+
+        assert len(results) == 3
+        assert all(isinstance(r, RuntimeError) for r in results)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -4,6 +4,8 @@ Tests for NEU inference module
 
 import pytest
 import numpy as np
+import cv2
+import os
 import sys
 from pathlib import Path
 
@@ -12,8 +14,10 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from inference.neu_inference import (
     preprocess_image,
+    preprocess_batch,
     run_inference,
     mock_inference,
+    _mock_core,
     CLASS_NAMES,
     IMG_SIZE
 )
@@ -50,6 +54,14 @@ class TestPreprocessing:
         assert processed.min() >= 0.0, f"Min value {processed.min()} < 0"
         assert processed.max() <= 1.0, f"Max value {processed.max()} > 1"
     
+    def test_matches_notebook_division(self):
+        """Test reciprocal normalization stays within 1 ulp of / 255.0"""
+        img = np.arange(256, dtype=np.uint8).reshape(16, 16)
+        processed = preprocess_image(img)
+        
+        expected = cv2.resize(img, (IMG_SIZE, IMG_SIZE)).astype("float32") / 255.0
+        assert np.allclose(processed[:, :, 0], expected, rtol=0, atol=1e-7)
+    
     def test_grayscale_conversion(self):
         """Test RGB to grayscale conversion"""
         # Create RGB image
@@ -74,6 +86,85 @@ class TestPreprocessing:
         assert np.allclose(processed, 0.0, atol=0.01)
 
 
+class TestPreprocessBatch:
+    """Test batched preprocessing matches per-image preprocessing"""
+    
+    def test_matches_preprocess_image(self, monkeypatch):
+        """Test batch output is identical to stacked preprocess_image"""
+        from inference import neu_inference
+        monkeypatch.setattr(neu_inference, "USE_NUMBA_PREPROCESS", False)
+        
+        images = [
+            np.random.randint(0, 256, (100, 150), dtype=np.uint8),
+            np.random.randint(0, 256, (300, 400, 3), dtype=np.uint8),
+            np.random.randint(0, 256, (200, 200, 1), dtype=np.uint8),
+        ]
+        
+        batch = preprocess_batch(images)
+        expected = np.stack([preprocess_image(img) for img in images], axis=0)
+        
+        assert batch.shape == (3, IMG_SIZE, IMG_SIZE, 1)
+        assert batch.dtype == np.float32
+        assert np.array_equal(batch, expected)
+    
+    def test_non_uint8_view_uses_its_own_pixels(self, monkeypatch):
+        """Test a view cv2 cannot resize in place is not replaced by the previous one"""
+        from inference import neu_inference
+        monkeypatch.setattr(neu_inference, "USE_NUMBA_PREPROCESS", False)
+        
+        images = [
+            np.full((50, 50), 255, dtype=np.uint8),
+            np.zeros((60, 60), dtype=np.uint16),
+        ]
+        
+        batch = preprocess_batch(images)
+        
+        assert np.array_equal(batch[1], preprocess_image(images[1]))
+        assert batch[1].max() == 0.0
+    
+    def test_rejects_multichannel_view(self, monkeypatch):
+        """Test an RGBA view raises instead of reusing the previous view's pixels"""
+        from inference import neu_inference
+        monkeypatch.setattr(neu_inference, "USE_NUMBA_PREPROCESS", False)
+        
+        images = [
+            np.full((50, 50), 255, dtype=np.uint8),
+            np.zeros((60, 60, 4), dtype=np.uint8),
+        ]
+        
+        with pytest.raises(ValueError):
+            preprocess_batch(images)
+    
+    def test_numba_kernel_matches_cv2(self, monkeypatch):
+        """Test the fused Numba path stays within one uint8 step of cv2"""
+        pytest.importorskip("numba")
+        from inference import neu_inference
+        monkeypatch.setattr(neu_inference, "USE_NUMBA_PREPROCESS", False)
+        
+        images = [
+            np.random.randint(0, 256, (100, 150), dtype=np.uint8),
+            np.random.randint(0, 256, (300, 400, 3), dtype=np.uint8),
+            np.random.randint(0, 256, (200, 200, 1), dtype=np.uint8),
+        ]
+        
+        expected = preprocess_batch(images)
+        X = np.empty_like(expected)
+        neu_inference._preprocess_batch_numba(images, X)
+        
+        assert np.allclose(X, expected, rtol=0, atol=1.0 / 255 + 1e-6)
+    
+    def test_numba_rejects_multichannel_view(self):
+        """Test the Numba path raises ValueError for views it cannot collapse to gray"""
+        pytest.importorskip("numba")
+        from inference import neu_inference
+        
+        images = [np.zeros((60, 60, 4), dtype=np.uint8)]
+        X = np.empty((1, IMG_SIZE, IMG_SIZE, 1), dtype=np.float32)
+        
+        with pytest.raises(ValueError):
+            neu_inference._preprocess_batch_numba(images, X)
+
+
 class TestMockInference:
     """Test mock inference behavior"""
     
@@ -114,6 +205,24 @@ class TestMockInference:
         assert result1["predicted_class"] == result2["predicted_class"]
         assert result1["anomaly_score"] == result2["anomaly_score"]
     
+    def test_does_not_touch_global_rng(self):
+        """Test mock inference leaves the global numpy RNG untouched"""
+        _mock_core.cache_clear()
+        np.random.seed(1234)
+        expected = np.random.random()
+        
+        np.random.seed(1234)
+        mock_inference("TEST_PIECE_RNG")
+        assert np.random.random() == expected
+    
+    def test_cached_results_are_independent(self):
+        """Test mutating a result does not leak into later calls"""
+        result1 = mock_inference("TEST_PIECE_CACHE")
+        result1["class_probs"]["crazing"] = -1.0
+        
+        result2 = mock_inference("TEST_PIECE_CACHE")
+        assert result2["class_probs"]["crazing"] >= 0.0
+    
     def test_anomaly_score_range(self):
         """Test anomaly score is in [0, 100]"""
         result = mock_inference("TEST_PIECE")
@@ -155,6 +264,111 @@ class TestRunInference:
         assert "predicted_class" in result
 
 
+class TestModelInference:
+    """Test the real-model path with a stubbed inference function"""
+    
+    def test_averages_views(self, monkeypatch):
+        """Test predictions are averaged across views"""
+        from inference import neu_inference
+        
+        def fake_infer(X):
+            assert X.shape == (2, IMG_SIZE, IMG_SIZE, 1)
+            assert X.dtype == np.float32
+            return np.array([
+                [0.1, 0.6, 0.1, 0.1, 0.05, 0.05],
+                [0.1, 0.2, 0.5, 0.1, 0.05, 0.05],
+            ], dtype=np.float32)
+        
+        monkeypatch.setattr(neu_inference, "_INFER_FN", fake_infer)
+        monkeypatch.setattr(neu_inference, "_MODEL_LOADED", True)
+        
+        images = [np.zeros((100, 100), dtype=np.uint8)] * 2
+        result = neu_inference.run_inference(images, piece_id="TEST")
+        
+        assert result["predicted_class"] == "inclusion"
+        assert np.isclose(result["class_probs"]["patches"], 0.3)
+        assert np.isclose(result["anomaly_score"], 40.0)
+
+
+class TestModelCache:
+    """Test the model is loaded once and reused"""
+    
+    def test_model_loaded_once(self, monkeypatch):
+        """Test repeated get_model calls do not reload the model"""
+        from inference import neu_inference
+        
+        calls = []
+        
+        def fake_load_model():
+            calls.append(1)
+            return None
+        
+        monkeypatch.setattr(neu_inference, "_MODEL", None)
+        monkeypatch.setattr(neu_inference, "_MODEL_LOADED", False)
+        monkeypatch.setattr(neu_inference, "load_model", fake_load_model)
+        
+        neu_inference.get_model()
+        neu_inference.get_model()
+        
+        assert len(calls) == 1
+    
+    def test_onnx_model_preferred(self, monkeypatch):
+        """Test the ONNX session is used instead of loading Keras"""
+        from inference import neu_inference
+        
+        class FakeInput:
+            name = "input"
+        
+        class FakeSession:
+            def get_inputs(self):
+                return [FakeInput()]
+            
+            def run(self, outputs, feeds):
+                X = feeds["input"]
+                return [np.full((len(X), 6), 1.0 / 6, dtype=np.float32)]
+        
+        def fail_load_model():
+            raise AssertionError("Keras model should not be loaded")
+        
+        monkeypatch.setattr(neu_inference, "_MODEL", None)
+        monkeypatch.setattr(neu_inference, "_INFER_FN", None)
+        monkeypatch.setattr(neu_inference, "_MODEL_LOADED", False)
+        monkeypatch.setattr(neu_inference, "load_onnx_model", FakeSession)
+        monkeypatch.setattr(neu_inference, "load_model", fail_load_model)
+        
+        preds = neu_inference.get_infer_fn()(np.zeros((3, IMG_SIZE, IMG_SIZE, 1), np.float32))
+        
+        assert preds.shape == (3, 6)
+    
+    def test_onnx_disabled_by_default(self, monkeypatch, tmp_path):
+        """Test an ONNX export on disk is ignored unless USE_ONNX is set"""
+        from inference import neu_inference
+        
+        onnx_path = tmp_path / "model.int8.onnx"
+        onnx_path.write_bytes(b"onnx")
+        monkeypatch.setattr(neu_inference, "USE_ONNX", False)
+        monkeypatch.setattr(neu_inference, "ONNX_MODEL_PATH", str(onnx_path))
+        
+        assert neu_inference.load_onnx_model() is None
+    
+    def test_stale_onnx_skipped(self, monkeypatch, tmp_path, capsys):
+        """Test an ONNX export older than the Keras model is not served"""
+        from inference import neu_inference
+        
+        onnx_path = tmp_path / "model.int8.onnx"
+        keras_path = tmp_path / "model.keras"
+        onnx_path.write_bytes(b"onnx")
+        keras_path.write_bytes(b"keras")
+        # Keras model retrained after the export
+        os.utime(onnx_path, (1_000_000, 1_000_000))
+        monkeypatch.setattr(neu_inference, "USE_ONNX", True)
+        monkeypatch.setattr(neu_inference, "ONNX_MODEL_PATH", str(onnx_path))
+        monkeypatch.setattr(neu_inference, "MODEL_PATH", str(keras_path))
+        
+        assert neu_inference.load_onnx_model() is None
+        assert "older than" in capsys.readouterr().out
+
+
 class TestConstants:
     """Test that constants match notebook"""
     
@@ -0,0 +1,97 @@
+"""
+Tests for piece storage backends
+"""
+
+import pytest
+import asyncio
+import sys
+from pathlib import Path
+
+# Add backend to path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.store import MemoryPieceStore, RedisPieceStore
+
+
+def _memory_store():
+    return MemoryPieceStore()
+
+
+def _redis_store():
+    fakeredis = pytest.importorskip("fakeredis")
+    return RedisPieceStore(client=fakeredis.FakeAsyncRedis(decode_responses=True))
+
+
+PIECE = {
+    "id": "PIECE_1",
+    "filename": "test.stl",
+    "uploaded_at": "2024-02-05T12:34:56.789",
+    "status": "uploaded",
+    "analysis_results": None
+}
+
+
+@pytest.fixture(params=[_memory_store, _redis_store], ids=["memory", "redis"])
+def store(request):
+    return request.param()
+
+
+class TestPieceStore:
+    """Test both backends behave the same"""
+
+    def test_set_and_get(self, store):
+        """Test a stored piece round-trips unchanged"""
+        async def scenario():
+            await store.set("PIECE_1", dict(PIECE))
+            return await store.get("PIECE_1")
+
+        assert asyncio.run(scenario()) == PIECE
+
+    def test_missing_piece(self, store):
+        """Test an unknown piece returns None"""
+        assert asyncio.run(store.get("NONEXISTENT")) is None
+
+    def test_list(self, store):
+        """Test list returns every stored piece"""
+        async def scenario():
+            await store.set("PIECE_1", dict(PIECE))
+            await store.set("PIECE_2", dict(PIECE, id="PIECE_2"))
+            return await store.list()
+
+        pieces = asyncio.run(scenario())
+        assert sorted(p["id"] for p in pieces) == ["PIECE_1", "PIECE_2"]
+
+    def test_list_empty(self, store):
+        """Test list of an empty store"""
+        assert asyncio.run(store.list()) == []
+
+    def test_update_keeps_other_fields(self, store):
+        """Test updates from interleaved handlers do not erase each other"""
+        async def scenario():
+            await store.set("PIECE_1", dict(PIECE))
+            # analyze reads first, then a validate lands before it writes back
+            await store.get("PIECE_1")
+            await store.update("PIECE_1", {"status": "validated", "validated_at": "t1"})
+            await store.update("PIECE_1", {
+                "analysis_results": {"predicted_class": "crazing"},
+                "analyzed_at": "t2"
+            })
+            return await store.get("PIECE_1")
+
+        piece = asyncio.run(scenario())
+        assert piece["validated_at"] == "t1"
+        assert piece["analysis_results"] == {"predicted_class": "crazing"}
+        assert piece["filename"] == "test.stl"
+
+    def test_set_replaces_piece(self, store):
+        """Test set drops fields that are not in the new piece"""
+        async def scenario():
+            await store.set("PIECE_1", dict(PIECE, report_path="r.json"))
+            await store.set("PIECE_1", dict(PIECE))
+            return await store.get("PIECE_1")
+
+        assert "report_path" not in asyncio.run(scenario())
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -10,7 +10,7 @@ cd backend
 # Run preprocessing tests
 echo ""
 echo "→ Testing Preprocessing..."
-pytest tests/test_inference.py::TestPreprocessing -v
+pytest tests/test_inference.py::TestPreprocessing tests/test_inference.py::TestPreprocessBatch -v
 
 # Run mock inference tests
 echo ""
@@ -20,13 +20,28 @@ pytest tests/test_inference.py::TestMockInference -v
 # Run real inference tests
 echo ""
 echo "→ Testing Run Inference..."
-pytest tests/test_inference.py::TestRunInference -v
+pytest tests/test_inference.py::TestRunInference tests/test_inference.py::TestModelInference -v
+
+# Run model cache tests
+echo ""
+echo "→ Testing Model Cache..."
+pytest tests/test_inference.py::TestModelCache -v
 
 # Run constants tests
 echo ""
 echo "→ Testing Constants..."
 pytest tests/test_inference.py::TestConstants -v
 
+# Run batching tests
+echo ""
+echo "→ Testing Dynamic Batching..."
+pytest tests/test_batching.py -v
+
+# Run store tests
+echo ""
+echo "→ Testing Piece Store..."
+pytest tests/test_store.py -v
+
 # Run API tests
 echo ""
 echo "→ Testing API Endpoints..."